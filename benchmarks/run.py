@@ -0,0 +1,243 @@
+"""
+Benchmark suite for the dashboard's hot paths, on synthetic data and without network access.
+
+For each benchmark it records wall time, peak traced memory (python and numpy allocations) and,
+where there is one, the size of the payload sent to the browser. Tracing memory slows python code
+down a lot, so the suite runs twice in fresh processes: once for wall time and once for memory.
+The benchmarks are:
+- readToDf on the synthetic csv
+- loading the picker options
+- refreshing the data: cold, after one appended day, and unchanged; plus the refresh_covid_data callback
+- update_graph for 1, 10 and 50 selected counties over the full date range, cold and cached
+
+Results are saved as json in benchmarks/results/<label>.json; --compare checks them against an
+earlier run and exits with status 1 on regressions.
+
+	python benchmarks/run.py --counties 3300 --days 1000 --label full
+	python benchmarks/run.py --compare benchmarks/results/baseline.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic import countyNames, generateFrame
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SELECTION_SIZES = [1, 10, 50]
+# relative growth in time or memory reported as a regression by --compare
+TOLERANCE = 0.2
+# growth below these is timer, allocator or scheduling noise, whatever the relative change
+MIN_DELTA = {'wall_s': 0.005, 'peak_bytes': 1024 * 1024, 'payload_bytes': 1024}
+
+
+def measure(fn, traced):
+	'''
+	run fn once, timing it or tracing its peak memory
+	:param traced: bool - trace memory instead of timing
+	:return: tuple (fn's result, dict with wall_s or peak_bytes)
+	'''
+	if not traced:
+		start = time.perf_counter()
+		result = fn()
+		return result, {'wall_s': time.perf_counter() - start}
+	tracemalloc.start()
+	try:
+		result = fn()
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return result, {'peak_bytes': peak}
+
+
+def callbackRequest(outputs, inputs, state, changed):
+	'''
+	body of a dash callback request, so callbacks are measured through the server like in production
+	'''
+	return {
+		'output': '..' + '...'.join(f'{id}.{prop}' for id, prop in outputs) + '..',
+		'outputs': [{'id': id, 'property': prop} for id, prop in outputs],
+		'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+		'state': [{'id': id, 'property': prop, 'value': value} for id, prop, value in state],
+		'changedPropIds': [changed],
+	}
+
+
+def postCallback(client, body):
+	response = client.post('/_dash-update-component', json=body)
+	if response.status_code != 200:
+		raise RuntimeError(f'callback failed with {response.status_code}: {response.data[:200]}')
+	return len(response.data)
+
+
+def runBenchmarks(counties, days, workDir, traced):
+	csvPath = os.path.join(workDir, 'us-counties.csv')
+	df = generateFrame(counties, days)
+	df.to_csv(csvPath, index=False)
+	lastDate = df['date'].iloc[-1]
+	nextDate = (pd.Timestamp(lastDate) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+	appendRows = df[df['date'] == lastDate].assign(date=nextDate)
+	del df
+
+	# the app reads its source and cache location at import
+	os.environ['COVID_DATA_URL'] = csvPath
+	os.environ['COVID_CACHE_DIR'] = os.path.join(workDir, 'cache')
+	import covid_app_dash as app
+	from covidData import COVID_DTYPES, readToDf
+	from pickerOptions import buildPickerData, loadPickerOptions, writePickerData
+
+	results = {}
+
+	_, results['readToDf'] = measure(lambda: readToDf(csvPath, COVID_DTYPES), traced)
+	results['readToDf']['payload_bytes'] = os.path.getsize(csvPath)
+
+	optionsPath = os.path.join(workDir, 'pickerOptions.json')
+	writePickerData(buildPickerData(includeCities=False), optionsPath)
+	options, results['options'] = measure(lambda: loadPickerOptions(optionsPath), traced)
+	results['options']['payload_bytes'] = len(json.dumps(options))
+
+	_, results['refresh_cold'] = measure(app.refresher.refresh, traced)
+	# the source file changes only when a day is appended, as the NYT file does
+	time.sleep(0.01)
+	appendRows.to_csv(csvPath, mode='a', header=False, index=False)
+	_, results['refresh_append'] = measure(app.refresher.refresh, traced)
+	_, results['refresh_unchanged'] = measure(app.refresher.refresh, traced)
+
+	client = app.server.test_client()
+	refreshBody = callbackRequest(
+		[
+			('data-last-refresh', 'children'), ('top10_daily', 'data'), ('top10_weekly', 'data'),
+			('interval-component', 'interval'), ('data-version', 'children'),
+		],
+		[('interval-component', 'n_intervals', 1)], [('data-version', 'children', '')], 'interval-component.n_intervals'
+	)
+	size, results['refresh_covid_data'] = measure(lambda: postCallback(client, refreshBody), traced)
+	results['refresh_covid_data']['payload_bytes'] = size
+
+	names = countyNames(counties)
+	end = nextDate
+	for selected in SELECTION_SIZES:
+		step = max(len(names) // selected, 1)
+		values = [county + ',' + state for county, state in names[::step][:selected]]
+		body = callbackRequest(
+			[('my_graph', 'figure'), ('daily_graph', 'figure'), ('mortality_graph', 'figure'), ('saved-data', 'children')],
+			[
+				('submit-button', 'n_clicks', 1), ('my_graph', 'relayoutData', None), ('daily_graph', 'relayoutData', None),
+				('mortality_graph', 'relayoutData', None),
+				('data-version', 'children', ''),
+			],
+			[
+				('state_county_picker', 'value', values),
+				('my_date_picker', 'start_date', '2020-01-21'),
+				('my_date_picker', 'end_date', end),
+				('saved-data', 'children', ''),
+			],
+			'submit-button.n_clicks'
+		)
+		app.traceCache.clear()
+		app.figureCache.clear()
+		size, results[f'update_graph_{selected}_cold'] = measure(lambda: postCallback(client, body), traced)
+		results[f'update_graph_{selected}_cold']['payload_bytes'] = size
+		size, results[f'update_graph_{selected}_cached'] = measure(lambda: postCallback(client, body), traced)
+		results[f'update_graph_{selected}_cached']['payload_bytes'] = size
+	return results
+
+
+def compare(results, baseline, tolerance):
+	'''
+	:return: list of strings describing every metric that grew by more than tolerance and by more than its MIN_DELTA
+	'''
+	regressions = []
+	for name, metrics in results.items():
+		for key, value in metrics.items():
+			before = baseline.get(name, {}).get(key)
+			if before and value > before * (1 + tolerance) and value - before > MIN_DELTA.get(key, 0):
+				regressions.append(f'{name}.{key}: {before:.4g} -> {value:.4g} (+{value / before - 1:.0%})')
+	return regressions
+
+
+def gitRevision():
+	try:
+		return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--counties', type=int, default=500)
+	parser.add_argument('--days', type=int, default=400)
+	parser.add_argument('--label', help='name of the results file, defaults to the git revision')
+	parser.add_argument('--compare', help='results file of an earlier run to check for regressions')
+	parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+	parser.add_argument('--pass', dest='passName', choices=['time', 'memory'], help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.passName:
+		# one pass of the suite in this process; the parent collects the json from stdout
+		with tempfile.TemporaryDirectory() as workDir:
+			results = runBenchmarks(args.counties, args.days, workDir, traced=args.passName == 'memory')
+		print(json.dumps(results))
+		return
+
+	# read the baseline first, it may be the file this run is about to overwrite
+	baseline = None
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+
+	results = {}
+	for passName in ('time', 'memory'):
+		out = subprocess.run(
+			[sys.executable, os.path.abspath(__file__), '--pass', passName, '--counties', str(args.counties), '--days', str(args.days)],
+			check=True, stdout=subprocess.PIPE, text=True
+		)
+		for name, metrics in json.loads(out.stdout.strip().splitlines()[-1]).items():
+			results.setdefault(name, {}).update(metrics)
+
+	revision = gitRevision()
+	report = {
+		'meta': {
+			'revision': revision,
+			'counties': args.counties,
+			'days': args.days,
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		},
+		'results': results,
+	}
+	os.makedirs(RESULTS_DIR, exist_ok=True)
+	path = os.path.join(RESULTS_DIR, (args.label or revision) + '.json')
+	with open(path, 'w') as f:
+		json.dump(report, f, indent=2)
+
+	for name, metrics in results.items():
+		payload = metrics.get('payload_bytes')
+		print(f"{name:28} {metrics['wall_s'] * 1000:10.1f} ms {metrics['peak_bytes'] / 2**20:9.1f} MiB"
+			+ (f' {payload / 1024:10.1f} KiB' if payload is not None else ''))
+	print(f'saved {path}')
+
+	if baseline is not None:
+		if baseline['meta']['counties'] != args.counties or baseline['meta']['days'] != args.days:
+			print('warning: the baseline was run on a different data size')
+		regressions = compare(results, baseline['results'], args.tolerance)
+		for line in regressions:
+			print('REGRESSION ' + line)
+		if regressions:
+			sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
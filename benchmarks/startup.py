@@ -0,0 +1,95 @@
+"""
+Startup-time benchmark for the dashboard.
+
+Times a cold `import covid_app_dash` in fresh processes (pointed at an empty cache and an unreachable
+data source, so any network access at import would show up as an error or a stall), and compares
+building the picker options the old way (parsing stateCountyData and two iterrows() loops) with
+loading the prebuilt artifact.
+
+	python benchmarks/startup.py [--runs 5]
+
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def timeImport(runs):
+	'''
+	:param runs: int - number of fresh processes
+	:return: list of import times in seconds
+	'''
+	times = []
+	with tempfile.TemporaryDirectory() as tmp:
+		env = dict(os.environ, COVID_CACHE_DIR=os.path.join(tmp, 'cache'), COVID_DATA_URL=os.path.join(tmp, 'missing.csv'))
+		code = 'import time; t = time.perf_counter(); import covid_app_dash; print(time.perf_counter() - t)'
+		for _ in range(runs):
+			out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+			times.append(float(out.stdout.strip().splitlines()[-1]))
+	return times
+
+
+def legacyOptions():
+	'''
+	the picker options as they used to be built at import, without the wikipedia scrape
+	'''
+	import pandas as pd
+	from stateCounties import stateCountyData
+	from pickerOptions import CITIES_NO_COUNTIES
+
+	stateCounty = pd.read_json(io.StringIO(stateCountyData), dtype={'county': str, 'state': str})
+	options = []
+	for index, row in stateCounty.iterrows():
+		myDict = {}
+		if (row['county'] in CITIES_NO_COUNTIES):
+			myDict['label'] = row['county'] + ', ' + row['state']
+		else:
+			myDict['label'] = row['county'] + ' County, ' + row['state']
+		myDict['value'] = row['county'] + ',' + row['state']
+		options.append(myDict)
+	return options
+
+
+def prebuiltOptions():
+	from pickerOptions import buildPickerData, loadPickerOptions, writePickerData
+
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, 'pickerOptions.json')
+		writePickerData(buildPickerData(includeCities=False), path)
+		start = time.perf_counter()
+		options = loadPickerOptions(path)
+		return options, time.perf_counter() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--runs', type=int, default=5)
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	legacy = legacyOptions()
+	legacyTime = time.perf_counter() - start
+	prebuilt, prebuiltTime = prebuiltOptions()
+	assert legacy == prebuilt[:len(legacy)]
+
+	imports = timeImport(args.runs)
+	results = {
+		'import_median_s': statistics.median(imports),
+		'import_max_s': max(imports),
+		'options_legacy_s': legacyTime,
+		'options_prebuilt_s': prebuiltTime,
+	}
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,86 @@
+"""
+Synthetic NY Times-shaped county data for benchmarks.
+
+Generates `counties` x `days` rows in the us-counties.csv schema (date, county, state, fips, cases,
+deaths), sorted by date like the real file, with cumulative cases and deaths. The first counties
+are the real ones from stateCounties.py so picker values work unchanged; beyond those, synthetic
+counties are added. A few 'Unknown' rows are mixed in, as readToDf has to drop them.
+
+	python benchmarks/synthetic.py out.csv --counties 3300 --days 1000
+
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pickerOptions import buildPickerData
+
+FIRST_DATE = '2020-01-21'
+UNKNOWN_EVERY = 5
+
+
+def countyNames(counties):
+	'''
+	:param counties: int - number of counties
+	:return: list of [county, state], real ones first
+	'''
+	names = buildPickerData(includeCities=False)['counties']
+	states = sorted({state for _, state in names})
+	for i in range(len(names), counties):
+		names.append([f'Synthetic {i}', states[i % len(states)]])
+	return names[:counties]
+
+
+def generateFrame(counties, days, seed=0):
+	'''
+	:param counties: int - number of counties
+	:param days: int - number of days from FIRST_DATE
+	:param seed: int - random seed
+	:return: dataframe in the NYT schema, sorted by date
+	'''
+	rng = np.random.default_rng(seed)
+	names = countyNames(counties)
+	# the real file has an 'Unknown' county in most states; a few are enough here
+	names += [['Unknown', state] for state in sorted({state for _, state in names})[::UNKNOWN_EVERY]]
+	n = len(names)
+
+	daily = rng.poisson(rng.gamma(1.0, 20.0, size=n), size=(days, n))
+	cases = daily.cumsum(axis=0)
+	deaths = rng.binomial(daily, 0.015).cumsum(axis=0)
+	fips = np.array([f'{i:05d}' for i in range(n)], dtype=object)
+	fips[[i for i, (county, _) in enumerate(names) if county in ('New York City', 'Kansas City', 'Unknown')]] = None
+
+	dates = pd.date_range(FIRST_DATE, periods=days, freq='D')
+	return pd.DataFrame({
+		'date': np.repeat(dates.strftime('%Y-%m-%d').to_numpy(), n),
+		'county': np.tile(np.array([county for county, _ in names], dtype=object), days),
+		'state': np.tile(np.array([state for _, state in names], dtype=object), days),
+		'fips': np.tile(fips, days),
+		'cases': cases.ravel(),
+		'deaths': deaths.ravel(),
+	})
+
+
+def writeCsv(path, counties, days, seed=0):
+	'''
+	write a synthetic us-counties.csv
+	:return: string - path
+	'''
+	generateFrame(counties, days, seed).to_csv(path, index=False)
+	return path
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('path')
+	parser.add_argument('--counties', type=int, default=3300)
+	parser.add_argument('--days', type=int, default=1000)
+	parser.add_argument('--seed', type=int, default=0)
+	args = parser.parse_args()
+	writeCsv(args.path, args.counties, args.days, args.seed)
@@ -0,0 +1,77 @@
+"""
+In-memory prefix index over the picker options, for server-side dropdown search.
+
+Every option label ('Hudson County, New Jersey', 'Jersey City, New Jersey', ...) is split into
+lowercase words, with a sorted list of the distinct words and, per word, the options containing it.
+A query matches an option when each of its words is a prefix of one of the option's words; each
+word is looked up with a binary search over the sorted list.
+
+"""
+from bisect import bisect_left
+import re
+
+SEARCH_LIMIT = 50
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def words(text):
+	return _WORD.findall(text.lower())
+
+
+class PrefixIndex:
+	'''
+	word-prefix index over dropdown options
+	'''
+
+	def __init__(self, options):
+		'''
+		:param options: list of {'label': ..., 'value': ...} dropdown options
+		'''
+		self.options = options
+		self._postings = {}
+		for i, option in enumerate(options):
+			for word in set(words(option['label'])):
+				self._postings.setdefault(word, []).append(i)
+		self._words = sorted(self._postings)
+		self._labels = [option['label'].lower() for option in options]
+		# options sharing a value (a county and its city alias) resolve to the first, the county
+		self.byValue = {}
+		for option in options:
+			self.byValue.setdefault(option['value'], option)
+
+	def _prefixIds(self, prefix):
+		ids = set()
+		i = bisect_left(self._words, prefix)
+		while i < len(self._words) and self._words[i].startswith(prefix):
+			ids.update(self._postings[self._words[i]])
+			i += 1
+		return ids
+
+	def search(self, query, limit=SEARCH_LIMIT):
+		'''
+		:param query: string - what the user typed
+		:param limit: int - most options to return
+		:return: list of matching options, labels starting with the query first, then shorter labels
+		'''
+		queryWords = words(query)
+		if not queryWords:
+			return []
+		# look up the longest (most selective) word first
+		queryWords.sort(key=len, reverse=True)
+		ids = self._prefixIds(queryWords[0])
+		for word in queryWords[1:]:
+			if not ids:
+				break
+			ids &= self._prefixIds(word)
+		query = query.strip().lower()
+		ranked = sorted(ids, key=lambda i: (not self._labels[i].startswith(query), len(self._labels[i]), i))
+		matches = []
+		seen = set()
+		for i in ranked:
+			option = self.options[i]
+			if option['value'] not in seen:
+				seen.add(option['value'])
+				matches.append(option)
+				if len(matches) == limit:
+					break
+		return matches
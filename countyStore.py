@@ -0,0 +1,53 @@
+"""
+Per-county time-series store for the NYT county data.
+
+The store keeps every (state, county) series as a contiguous, date-sorted slice of a few flat
+numpy arrays, so reading one county's date window is a dict lookup plus a binary search instead
+of a scan over the whole frame. The arrays are the memory-mapped columns of a snapshot, so every
+worker reads the same pages. State and national rollups are stored as the county ROLLUP_COUNTY.
+
+"""
+from collections import namedtuple
+
+from snapshot import EPOCH, toDays
+
+# one county's series inside a date window; every field is a numpy array of the same length
+CountySeries = namedtuple('CountySeries', [
+	'date', 'cases', 'deaths', 'new_cases', 'new_deaths', 'avg7_cases', 'avg14_cases', 'avg7_deaths', 'avg14_deaths',
+	'mortality', 'slope14', 'trend14',
+])
+
+
+class CountyStore:
+	'''
+	index of a snapshot keyed by (state, county)
+	'''
+
+	def __init__(self, snapshot):
+		'''
+		:param snapshot: Snapshot - rows sorted by state, county and date
+		'''
+		self.snapshot = snapshot
+		self.day = snapshot['date']
+		self.index = snapshot.groups()
+
+	def __len__(self):
+		return len(self.day)
+
+	def __contains__(self, key):
+		return key in self.index
+
+	def window(self, state, county, start, end):
+		'''
+		return one county's series between two dates, inclusive on both ends
+		:param state: string - state name
+		:param county: string - county name
+		:param start: datetime - first date of the window
+		:param end: datetime - last date of the window
+		:return: CountySeries of array views (dates as datetime64[D]), empty if the county is unknown
+		'''
+		lo, hi = self.index.get((state, county), (0, 0))
+		days = self.day[lo:hi]
+		first = lo + days.searchsorted(toDays(start), side='left')
+		last = lo + days.searchsorted(toDays(end), side='right')
+		return CountySeries(EPOCH + self.day[first:last], *(self.snapshot[name][first:last] for name in CountySeries._fields[1:]))
@@ -0,0 +1,298 @@
+"""
+Loading and refreshing of the NY Times covid-19 county data.
+
+One DataRefresher per process keeps the current Dataset in memory. Refreshes are conditional
+(ETag / Last-Modified, or mtime for local files). When the source only gained rows for new dates,
+just those rows are parsed, their metrics are computed from the last days of each series, and
+they are merged into the previous snapshot's columns; anything else is a full rebuild. Either way
+the result is written as a new memory-mapped snapshot shared by every process on the box. A file
+lock makes sure only one process downloads at a time; the others wait for it and then map the new
+snapshot. The new Dataset replaces the old one with a single assignment, so
+callbacks always see either the old or the new data, never a mix.
+
+"""
+from datetime import datetime
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+import zlib
+
+import pandas as pd
+
+from countyStore import CountyStore
+from instrumentation import DATA_LOAD_SECONDS
+from covidMetrics import CONTEXT_DAYS, appendMetrics, computeMetrics, topMovers
+from snapshot import SNAPSHOT_FORMAT, Snapshot, extendSnapshot, snapshotPath, writeSnapshot
+
+try:
+	import fcntl
+except ImportError:  # windows: no cross-process locking, each process refreshes on its own
+	fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COVID_DTYPES = {'county': str, 'state': str, 'fips': str, 'cases': int, 'deaths': int}
+NYT_REPO = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
+
+# the source can be pointed at a local file or a local http server, e.g. for development or benchmarks
+DATA_URL = os.environ.get('COVID_DATA_URL', NYT_REPO)
+CACHE_DIR = os.environ.get('COVID_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.covid_cache'))
+REFRESH_SECONDS = int(os.environ.get('COVID_REFRESH_SECONDS', 3600))
+
+
+def readToDf(url, dTypes):
+	'''
+	read NY Times covid-19 county data into a dataframe and clear unknown counties
+	:param url: string - github repo url, local path or file-like object holding the csv
+	:param dTypes: dict key = col, val = dtype
+	:return: cleaned NYT dataframe
+	'''
+	if isinstance(url, str) and url.startswith(('http://', 'https://')):
+		with DATA_LOAD_SECONDS.time(phase='download'):
+			url = io.BytesIO(fetchSource(url)[0])
+	with DATA_LOAD_SECONDS.time(phase='parse'):
+		df = pd.read_csv(url, dtype=dTypes, parse_dates=[0])
+	with DATA_LOAD_SECONDS.time(phase='filter'):
+		df = df.loc[~(df['county']=='Unknown')]
+	return df
+
+
+def fetchSource(url, validators=None):
+	'''
+	fetch the csv unless it is unchanged since the last fetch
+	:param url: string - http(s) url, file:// url or local path
+	:param validators: dict with the 'etag' and 'lastModified' of the previous fetch
+	:return: tuple (bytes or None if unchanged, dict of validators for the next fetch)
+	'''
+	validators = validators or {}
+	if not url.startswith(('http://', 'https://')):
+		path = url[len('file://'):] if url.startswith('file://') else url
+		stat = os.stat(path)
+		etag = f'{stat.st_mtime_ns}-{stat.st_size}'
+		if etag == validators.get('etag'):
+			return None, validators
+		with open(path, 'rb') as f:
+			return f.read(), {'etag': etag, 'lastModified': None}
+
+	request = urllib.request.Request(url)
+	if validators.get('etag'):
+		request.add_header('If-None-Match', validators['etag'])
+	if validators.get('lastModified'):
+		request.add_header('If-Modified-Since', validators['lastModified'])
+	try:
+		with urllib.request.urlopen(request, timeout=60) as response:
+			body = response.read()
+			headers = response.headers
+	except urllib.error.HTTPError as e:
+		if e.code == 304:
+			return None, validators
+		raise
+	return body, {'etag': headers.get('ETag'), 'lastModified': headers.get('Last-Modified')}
+
+
+def newRowsOffset(body, lastDate, previousSize, previousCrc):
+	'''
+	find where the rows for dates after lastDate start in a date-sorted csv
+	:param body: bytes - full csv
+	:param lastDate: string - last date (YYYY-MM-DD) already parsed
+	:param previousSize: int - byte size of the csv when lastDate was parsed
+	:param previousCrc: int - crc32 of the csv when lastDate was parsed
+	:return: byte offset of the first new row, or None if earlier rows changed and a full parse is needed
+	'''
+	if not lastDate or not previousSize or previousCrc is None:
+		return None
+	start = body.rfind(b'\n' + lastDate.encode() + b',')
+	if start == -1:
+		return None
+	end = body.find(b'\n', start + 1)
+	end = len(body) if end == -1 else end + 1
+	# anything but a pure append moves the end of the old rows or changes their checksum
+	if end != previousSize or zlib.crc32(memoryview(body)[:end]) != previousCrc:
+		return None
+	return end
+
+
+class Dataset:
+	'''
+	one immutable, memory-mapped version of the county data together with its per-county index
+	'''
+
+	def __init__(self, snapshot, version, updated):
+		self.snapshot = snapshot
+		self.store = CountyStore(snapshot)
+		self.version = version
+		self.updated = updated
+
+
+class DataRefresher:
+	'''
+	keeps the current Dataset and refreshes it in a single background thread
+	'''
+
+	def __init__(self, url=DATA_URL, cacheDir=CACHE_DIR, interval=REFRESH_SECONDS, dTypes=COVID_DTYPES):
+		self.url = url
+		self.cacheDir = cacheDir
+		self.interval = interval
+		self.dTypes = dTypes
+		self.current = None
+		self._lock = threading.Lock()
+		self._thread = None
+		self._startLock = threading.Lock()
+		os.makedirs(cacheDir, exist_ok=True)
+		self._snapshotDir = os.path.join(cacheDir, 'snapshots')
+		os.makedirs(self._snapshotDir, exist_ok=True)
+		self._metaPath = os.path.join(cacheDir, 'meta.json')
+		self._lockPath = os.path.join(cacheDir, '.lock')
+
+	def _readMeta(self):
+		try:
+			with open(self._metaPath) as f:
+				meta = json.load(f)
+		except (OSError, ValueError):
+			return {}
+		# a cache written in an older snapshot format is treated as no cache at all
+		return meta if meta.get('format') == SNAPSHOT_FORMAT else {}
+
+	def _writeMeta(self, meta):
+		tmp = self._metaPath + f'.{os.getpid()}.tmp'
+		with open(tmp, 'w') as f:
+			json.dump(meta, f)
+		os.replace(tmp, self._metaPath)
+
+	def loadCache(self):
+		'''
+		map the snapshot named in the cache metadata if it is newer than the one in memory
+		:return: True if the in-memory dataset was replaced
+		'''
+		meta = self._readMeta()
+		version = meta.get('version')
+		if version is None or not os.path.exists(snapshotPath(self._snapshotDir, version)):
+			return False
+		if self.current is not None and self.current.version >= version:
+			return False
+		snapshot = Snapshot(snapshotPath(self._snapshotDir, version))
+		self.current = Dataset(snapshot, version, datetime.fromisoformat(meta['updated']))
+		return True
+
+	def _fetch(self):
+		'''
+		conditionally download the source, parse what is new and write the cache; caller holds the file lock
+		'''
+		meta = self._readMeta()
+		# another process may have refreshed while we waited
+		self.loadCache()
+		# with nothing in memory (or the snapshot named in the metadata gone) an 'unchanged' answer would
+		# leave the process without data, so fetch the whole file
+		previous = meta.get('validators')
+		if self.current is None or not os.path.exists(snapshotPath(self._snapshotDir, meta.get('version', 0))):
+			previous = None
+		with DATA_LOAD_SECONDS.time(phase='download'):
+			body, validators = fetchSource(self.url, previous)
+		if body is None:
+			logger.info('covid data unchanged at %s', self.url)
+			return
+
+		new = None
+		if self.current is not None and self.current.version == meta.get('version'):
+			offset = newRowsOffset(body, meta.get('lastDate'), meta.get('size'), meta.get('crc'))
+			if offset is not None:
+				tail = body[offset:]
+				if not tail.strip():
+					meta['validators'] = validators
+					self._writeMeta(meta)
+					return
+				header = body[:body.find(b'\n') + 1]
+				new = readToDf(io.BytesIO(header + tail), self.dTypes)
+				# the new rows are computed from the days before them, so they have to be later days
+				if len(new) and new['date'].min() <= pd.Timestamp(meta['lastDate']):
+					new = None
+		version = meta.get('version', 0) + 1
+		updated = datetime.now().astimezone()
+		# the metadata is the pointer to the current snapshot, so it is replaced only once the snapshot is complete
+		if new is None:
+			df = readToDf(io.BytesIO(body), self.dTypes)
+			lastDate = df['date'].max() if len(df) else None
+			with DATA_LOAD_SECONDS.time(phase='metrics'):
+				metrics = computeMetrics(df)
+				tables = topMovers(metrics)
+			with DATA_LOAD_SECONDS.time(phase='snapshot'):
+				path = writeSnapshot(metrics, self._snapshotDir, version, tables)
+		else:
+			# only the new days are computed and merged into the previous snapshot's columns
+			logger.info('parsed %d new bytes of covid data', len(tail))
+			lastDate = max(new['date'].max(), pd.Timestamp(meta['lastDate'])) if len(new) else pd.Timestamp(meta['lastDate'])
+			snapshot = self.current.snapshot
+			with DATA_LOAD_SECONDS.time(phase='metrics'):
+				metrics, tables = appendMetrics(snapshot.tail(CONTEXT_DAYS), new)
+			with DATA_LOAD_SECONDS.time(phase='snapshot'):
+				path = extendSnapshot(snapshot, metrics, self._snapshotDir, version, tables)
+		self._writeMeta({
+			'format': SNAPSHOT_FORMAT,
+			'version': version,
+			'updated': updated.isoformat(),
+			'validators': validators,
+			'lastDate': lastDate.strftime('%Y-%m-%d') if lastDate is not None else None,
+			'size': len(body),
+			'crc': zlib.crc32(body),
+		})
+		self.current = Dataset(Snapshot(path), version, updated)
+
+	def refresh(self):
+		'''
+		refresh the dataset once; concurrent calls in this process return immediately, concurrent
+		calls in other processes wait for the one doing the download and then reload its cache
+		:return: the current Dataset
+		'''
+		if not self._lock.acquire(blocking=False):
+			return self.current
+		try:
+			with open(self._lockPath, 'a') as lockFile:
+				if fcntl is None:
+					self._fetch()
+				else:
+					try:
+						fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+						fetching = True
+					except BlockingIOError:
+						fcntl.flock(lockFile, fcntl.LOCK_EX)
+						fetching = False
+					try:
+						if fetching:
+							self._fetch()
+						else:
+							self.loadCache()
+					finally:
+						fcntl.flock(lockFile, fcntl.LOCK_UN)
+		except Exception:
+			logger.exception('covid data refresh from %s failed', self.url)
+		finally:
+			self._lock.release()
+		return self.current
+
+	def _run(self):
+		while not self._stopped.is_set():
+			self.refresh()
+			self._stopped.wait(self.interval)
+
+	def start(self):
+		'''
+		start the background refresh thread; calling it again is a no-op
+		'''
+		if self._thread is not None:
+			return
+		with self._startLock:
+			if self._thread is not None:
+				return
+			self._stopped = threading.Event()
+			self._thread = threading.Thread(target=self._run, name='covid-data-refresher', daemon=True)
+			self._thread.start()
+
+	def stop(self):
+		if self._thread is not None:
+			self._stopped.set()
+			self._thread.join()
+			self._thread = None
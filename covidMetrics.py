@@ -0,0 +1,160 @@
+"""
+Derived metrics, computed once per data refresh for every county at the same time.
+
+computeMetrics adds state and national rollups to the county rows, then adds for every series:
+- new_cases / new_deaths: daily increase of the cumulative counts
+- avg7_* / avg14_*: trailing 7- and 14-day averages of the daily increase
+- mortality: deaths / cases
+- slope14 / trend14: slope and end value of a least-squares line through the last 14 days of cases
+topMovers ranks the counties by their increase over the latest day and week.
+
+Every metric of a row depends only on the CONTEXT_DAYS rows before it in its series, so appendMetrics
+computes newly published days from that much context instead of the whole history.
+Everything is done with grouped shifts and cumulative sums over the sorted frame, without a python
+loop over counties. Rows within a series are assumed to be consecutive days, as they are in the NYT
+data.
+
+"""
+import numpy as np
+import pandas as pd
+
+# rollup rows reuse the county columns: a state's total is the county ROLLUP_COUNTY of that state
+ROLLUP_COUNTY = 'All counties'
+NATION = 'United States'
+TREND_DAYS = 14
+TOP_N = 10
+# the longest window any metric looks back over
+CONTEXT_DAYS = 14
+
+
+def addRollups(df):
+	'''
+	append state and national totals as extra series
+	:param df: dataframe of county rows
+	:return: dataframe of county, state and national rows
+	'''
+	states = df.groupby(['state', 'date'], as_index=False)[['cases', 'deaths']].sum()
+	states['county'] = ROLLUP_COUNTY
+	nation = df.groupby('date', as_index=False)[['cases', 'deaths']].sum()
+	nation['state'] = NATION
+	nation['county'] = ROLLUP_COUNTY
+	return pd.concat([df, states, nation], ignore_index=True)
+
+
+def windowDiff(running, group, position, days):
+	'''
+	running[t] - running[t - days] within each series, taking the value before a series' first row as 0
+	:param running: numpy array - running totals, sorted by series and date
+	:param group: numpy array - series id of each row
+	:param position: numpy array - position of each row within its series
+	:param days: int - window length
+	:return: numpy array - sum of the last `days` increases of each row
+	'''
+	before = pd.Series(running).groupby(group, sort=False).shift(days).to_numpy()
+	return running - np.where(position >= days, before, 0)
+
+
+def runningTotal(values, group):
+	return pd.Series(values).groupby(group, sort=False).cumsum().to_numpy()
+
+
+def seriesIndex(df):
+	'''
+	:param df: dataframe sorted by state, county and date
+	:return: tuple of numpy arrays (series id, position within the series) of each row
+	'''
+	groups = df.groupby(['state', 'county'], sort=False)
+	return groups.ngroup().to_numpy(), groups.cumcount().to_numpy()
+
+
+def computeMetrics(df):
+	'''
+	:param df: dataframe with date, county, state, fips, cases and deaths of every county
+	:return: dataframe with rollup rows and the metric columns added, sorted by state, county and date
+	'''
+	df = addRollups(df).sort_values(['state', 'county', 'date'], kind='mergesort', ignore_index=True)
+	group, position = seriesIndex(df)
+	return addMetrics(df, group, position)
+
+
+def appendMetrics(context, new):
+	'''
+	metrics of newly published days, computed from the last CONTEXT_DAYS rows of every series
+	:param context: dataframe - the last CONTEXT_DAYS rows of each series, rollups included, with the
+		computeMetrics input columns
+	:param new: dataframe of county rows for dates after those in context
+	:return: tuple (new rows with rollups and metric columns, sorted by state, county and date; topMovers tables)
+	'''
+	df = pd.concat([context.assign(new=False), addRollups(new).assign(new=True)], ignore_index=True)
+	df = df.sort_values(['state', 'county', 'date'], kind='mergesort', ignore_index=True)
+	# positions count from the start of the context instead of the series: a new row is at least
+	# CONTEXT_DAYS in exactly when it would be in the whole series, and the trend fit doesn't depend on
+	# where t starts
+	group, position = seriesIndex(df)
+	df = addMetrics(df, group, position)
+	tables = topMovers(df)
+	return df.loc[df['new'].to_numpy()].drop(columns=['new']).reset_index(drop=True), tables
+
+
+def addMetrics(df, group, position):
+	'''
+	:param df: dataframe sorted by state, county and date
+	:param group: numpy array - series id of each row
+	:param position: numpy array - position of each row within its series
+	:return: df with the metric columns added
+	'''
+	cases = df['cases'].to_numpy(dtype=np.float64)
+	deaths = df['deaths'].to_numpy(dtype=np.float64)
+
+	# the cumulative counts are already running totals of the daily increases
+	for name, running in (('cases', cases), ('deaths', deaths)):
+		df['new_' + name] = windowDiff(running, group, position, 1)
+		for days in (7, 14):
+			df[f'avg{days}_{name}'] = windowDiff(running, group, position, days) / np.minimum(position + 1, days)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		df['mortality'] = np.where(cases > 0, deaths / cases, np.nan)
+
+	# rolling least squares of cases against the day position t, from running totals of y and t * y
+	sumY = windowDiff(runningTotal(cases, group), group, position, TREND_DAYS)
+	sumTY = windowDiff(runningTotal(cases * position, group), group, position, TREND_DAYS)
+	n = np.minimum(position + 1, TREND_DAYS).astype(np.float64)
+	last = position.astype(np.float64)
+	first = last - n + 1
+	sumT = n * (first + last) / 2
+	sumTT = (last * (last + 1) * (2 * last + 1) - (first - 1) * first * (2 * first - 1)) / 6
+	with np.errstate(divide='ignore', invalid='ignore'):
+		slope = (n * sumTY - sumT * sumY) / (n * sumTT - sumT ** 2)
+		trend = sumY / n + slope * (last - sumT / n)
+	df['slope14'] = np.where(n > 1, slope, np.nan)
+	df['trend14'] = np.where(n > 1, trend, np.nan)
+	return df
+
+
+def topMovers(df, n=TOP_N):
+	'''
+	counties with the most new cases on the latest date and over the latest week
+	:param df: output of computeMetrics, or any frame of whole series tails at least a week long
+	:param n: int - rows per table
+	:return: dict with 'daily' and 'weekly' lists of table records
+	'''
+	group, position = seriesIndex(df)
+	cases = df['cases'].to_numpy(dtype=np.float64)
+	latest = ((df['county'] != ROLLUP_COUNTY) & (df['date'] == df['date'].max())).to_numpy()
+	# the actual increase over the last 1 and 7 days, counted from 0 for series that started since
+	counties = df.loc[latest, ['county', 'state']].assign(
+		new_cases=windowDiff(cases, group, position, 1)[latest],
+		week=windowDiff(cases, group, position, 7)[latest],
+	)
+	daily = counties.nlargest(n, 'new_cases')
+	weekly = counties.nlargest(n, 'week')
+	return {
+		'daily': [
+			{'County': county, 'State': state, 'New cases': int(value)}
+			for county, state, value in zip(daily['county'], daily['state'], daily['new_cases'])
+		],
+		'weekly': [
+			{'County': county, 'State': state, 'New cases (7 days)': int(round(value))}
+			for county, state, value in zip(weekly['county'], weekly['state'], weekly['week'])
+		],
+	}
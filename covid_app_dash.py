@@ -3,17 +3,26 @@ This plotly dash app displays the latest Covid-19 infection numbers by U.S. coun
 
 """
 from datetime import datetime
+import json
 
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_table
 
+import numpy as np
 import pandas as pd
 
-from stateCounties import stateCountyData
+from covidData import CACHE_DIR, COVID_DTYPES, DATA_URL, REFRESH_SECONDS, DataRefresher
+from countySearch import PrefixIndex
+from covidMetrics import ROLLUP_COUNTY, TREND_DAYS
+from figureCache import FIGURE_CACHE_BYTES, LRUCache
+from instrumentation import Counter, Gauge, instrument, timed
+from payload import AVERAGE_DECIMALS, MORTALITY_DECIMALS, compactTrace
+from pickerOptions import CITIES_NO_COUNTIES, loadPickerOptions
 
 pd.set_option('display.max_rows', 500)
 pd.set_option('display.max_columns', 500)
@@ -24,6 +33,7 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MATERIA])
 app.title = 'U.S. Counties Covid-19 Dashboard'
 
 server = app.server
+instrument(app)
 
 # COLOR LIST - use this color list to force county cases + death color to match
 COLOR_LIST = [
@@ -33,48 +43,45 @@ COLOR_LIST = [
 ]
 COLOR_LIST_LEN = len(COLOR_LIST)
 
-# read data
-COVID_DTYPES = {'county': str, 'state': str, 'fips': str, 'cases': int, 'deaths': int}
-NYT_REPO = 'https://raw.githubusercontent.com/nytimes/covid-19-data/master/us-counties.csv'
+# the page checks for new data daily, and every few seconds while the first download is still running
+REFRESH_INTERVAL_MS = 86400000
+LOADING_INTERVAL_MS = 5000
 
-def readToDf(url, dTypes):
-	'''
-	read NY Times covid-19 county data into a dataframe and clear unknown counties
-	:param url: string - github repo url
-	:param dTypes: dict key = col, val = dtype
-	:return: cleaned NYT dataframe
-	'''
-	df = pd.read_csv(url, dtype=dTypes, parse_dates=[0])
-	df = df.loc[~(df['county']=='Unknown')]
-	return df
+# read data: map the shared snapshot if there is one. Downloading is left to the background
+# refresher, which is started by the first callback so importing the app never touches the network
+refresher = DataRefresher(DATA_URL, CACHE_DIR, REFRESH_SECONDS, COVID_DTYPES)
+refresher.loadCache()
 
-covid = readToDf(NYT_REPO,COVID_DTYPES)
+# memoized per-county series and whole figures, both keyed by the dataset version
+traceCache = LRUCache(FIGURE_CACHE_BYTES // 2)
+figureCache = LRUCache(FIGURE_CACHE_BYTES // 2)
 
+# metrics read at scrape time
+def datasetStat(stat):
+	dataset = refresher.current
+	return {(): stat(dataset)} if dataset is not None else {}
 
-# multidropdown options for state / county selection
-CITIES_NO_COUNTIES = ['New York City', 'Kansas City']
+def cacheStat(key):
+	return {('trace',): traceCache.stats()[key], ('figure',): figureCache.stats()[key]}
+
+Gauge('covid_dataset_rows', 'Rows in the current dataset, rollups included.',
+	fn=lambda: datasetStat(lambda dataset: len(dataset.store)))
+Gauge('covid_dataset_bytes', 'Size of the memory-mapped snapshot columns.',
+	fn=lambda: datasetStat(lambda dataset: sum(column.nbytes for column in dataset.snapshot.columns.values())))
+Gauge('covid_dataset_version', 'Version of the current dataset.', fn=lambda: datasetStat(lambda dataset: dataset.version))
+Counter('covid_cache_hits_total', 'Cache hits.', ['cache'], fn=lambda: cacheStat('hits'))
+Counter('covid_cache_misses_total', 'Cache misses.', ['cache'], fn=lambda: cacheStat('misses'))
+Counter('covid_cache_evictions_total', 'Cache evictions.', ['cache'], fn=lambda: cacheStat('evictions'))
+Gauge('covid_cache_bytes', 'Approximate memory held by the cache.', ['cache'], fn=lambda: cacheStat('bytes'))
+Gauge('covid_cache_entries', 'Entries in the cache.', ['cache'], fn=lambda: cacheStat('entries'))
 
-stateCounty = pd.read_json(stateCountyData, dtype=COVID_DTYPES)
-options = []
-for index, row in stateCounty.iterrows():
-	#{'Label': 'user sees', 'Value': 'script sees')
-	myDict = {}
-	if (row['county'] in CITIES_NO_COUNTIES):
-		myDict['label'] = row['county'] + ', ' + row['state']
-	else:
-		myDict['label'] = row['county'] + ' County, ' + row['state']
-	myDict['value'] = row['county'] + ',' + row['state']
-	options.append(myDict)
-
-# add options for us cities: 'label': 'city, state', 'value': 'county, state'
-table = pd.read_html('https://en.wikipedia.org/wiki/List_of_the_most_populous_counties_in_the_United_States', header=1)[0].dropna()
-table = table[~(table['County seat'].str.contains('NYC'))]
-table = table[~(table['County seat'].str.contains('Kansas City'))]
-for index, row in table.iterrows():
-	myDict = {}
-	myDict['label'] = row['County seat'] + ', ' + row['State']
-	myDict['value'] = row['County'] + ',' + row['State']
-	options.append(myDict)
+
+# multidropdown options for state / county selection, prebuilt by pickerOptions.py. Only the selected
+# options are sent with the layout; the rest are looked up server-side as the user types
+options = loadPickerOptions()
+countyIndex = PrefixIndex(options)
+DEFAULT_COUNTIES = ['New York City,New York', 'Hudson,New Jersey', 'Essex,New Jersey', 'Passaic,New Jersey',
+	'Middlesex,New Jersey']
 
 # LAYOUT
 app.layout = html.Div(
@@ -91,29 +98,39 @@ app.layout = html.Div(
 		),
 		html.Div(
 			[
-				# html.Div(
-				# 	[
-				# 		dash_table.DataTable(
-				# 			id='top10_daily',
-				# 			columns=[{"name": i, "id": i} for i in df.columns],
-				# 			data=df.to_dict('records'),
-				# 		),
-				# 		dash_table.DataTable(
-				# 			id='top10_weekly',
-				# 			columns=[{"name": i, "id": i} for i in df.columns],
-				# 			data=df.to_dict('records'),
-				# 		),
-				# 	]
-				# ),
+				html.Div(
+					[
+						html.Div(
+							[
+								html.H3('Most new cases, latest day'),
+								dash_table.DataTable(
+									id='top10_daily',
+									columns=[{"name": i, "id": i} for i in ['County', 'State', 'New cases']],
+									data=[],
+								),
+							], style={'display': 'inline-block', 'verticalAlign': 'top', 'width': '45%'}
+						),
+						html.Div(
+							[
+								html.H3('Most new cases, latest week'),
+								dash_table.DataTable(
+									id='top10_weekly',
+									columns=[{"name": i, "id": i} for i in ['County', 'State', 'New cases (7 days)']],
+									data=[],
+								),
+							], style={'display': 'inline-block', 'verticalAlign': 'top', 'width': '45%', 'paddingLeft': '30px'}
+						),
+					], style={'paddingBottom': '20px'}
+				),
 
 				html.Div(
 					[
 						html.H3('County and State selection:', style={'paddingRight': '30px'}),
 						dcc.Dropdown(
 							id='state_county_picker',
-							value=['New York City,New York', 'Hudson,New Jersey', 'Essex,New Jersey', 'Passaic,New Jersey',
-								'Middlesex,New Jersey'],
-							options= options,
+							value=DEFAULT_COUNTIES,
+							options=[countyIndex.byValue[value] for value in DEFAULT_COUNTIES if value in countyIndex.byValue],
+							placeholder='Type a county, city or state',
 							multi=True
 						)
 					], style={'display': 'inline-block', 'verticalAlign': 'top', 'width': '35%'}
@@ -153,6 +170,18 @@ app.layout = html.Div(
 					],
 					style={'height':'45%'}
 				),
+				html.Div(
+					[
+						dcc.Graph(
+							id='daily_graph',
+							figure = {
+								'data': [{'x':[1,2], 'y':[3,1]}],
+								'layout': {'title':'Default Title'}
+							}
+						),
+					],
+					style={'height':'30%'}
+				),
 				html.Div(
 					[
 						dcc.Graph(
@@ -179,9 +208,16 @@ app.layout = html.Div(
 				# Hidden components
 				dcc.Interval(
 					id='interval-component',
-					interval= 86400000,
+					interval=REFRESH_INTERVAL_MS,
 					n_intervals=0
 				),
+				# version of the data the page shows; a new version redraws the graphs
+				html.Div(
+					id='data-version',
+					style={'display':'none'},
+					children=''
+				),
+				# the selection and dates of the last submit, so zooming never picks up unsubmitted changes
 				html.Div(
 					id='saved-data',
 					style={'display':'none'},
@@ -193,23 +229,130 @@ app.layout = html.Div(
 	]
 )
 
-# refresh data daily
-@app.callback(Output('data-last-refresh', 'children'), [Input('interval-component', 'n_intervals')])
-def refresh_covid_data(n):
-	global covid
-	covid = readToDf(NYT_REPO,COVID_DTYPES)
-	now = datetime.now().astimezone().strftime('%Y-%m-%d %I:%M:%S %p %Z %z')
+# show when the data was last refreshed and its top movers; the download itself and the metrics
+# happen in the background refresher. Until the first download is done (a cold start has no cache)
+# the page polls quickly, and publishing the data version then fills in the graphs
+@app.callback(
+	[
+		Output('data-last-refresh', 'children'),
+		Output('top10_daily', 'data'),
+		Output('top10_weekly', 'data'),
+		Output('interval-component', 'interval'),
+		Output('data-version', 'children')
+	],
+	[Input('interval-component', 'n_intervals')],
+	[State('data-version', 'children')]
+)
+@timed('refresh_covid_data')
+def refresh_covid_data(n, shownVersion):
+	refresher.start()
+	dataset = refresher.current
+	if dataset is None:
+		return 'Last data refresh: loading...', [], [], LOADING_INTERVAL_MS, dash.no_update
+	now = dataset.updated.strftime('%Y-%m-%d %I:%M:%S %p %Z %z')
 	status = f'Last data refresh: {now}'
-	return status
+	tables = dataset.snapshot.tables
+	version = dataset.version if dataset.version != shownVersion else dash.no_update
+	return status, tables.get('daily', []), tables.get('weekly', []), REFRESH_INTERVAL_MS, version
 
 
-# update dashboard
+# search the picker options on the server instead of shipping all of them to the browser
+@app.callback(
+	Output('state_county_picker', 'options'),
+	[Input('state_county_picker', 'search_value')],
+	[State('state_county_picker', 'value')]
+)
+@timed('search_counties')
+def search_counties(search_value, selected):
+	if not search_value:
+		raise PreventUpdate
+	selected = selected or []
+	# selected options have to stay in the list or the dropdown loses their labels
+	selectedOptions = [countyIndex.byValue[value] for value in selected if value in countyIndex.byValue]
+	return selectedOptions + [option for option in countyIndex.search(search_value) if option['value'] not in selected]
+
+
+def countySeries(dataset, item, start, end):
+	'''
+	one county's compact cumulative, daily, mortality and trend traces in a date window, memoized per dataset version
+	:param dataset: Dataset - current data
+	:param item: string - picker value 'county,state'
+	:param start: datetime - first date of the window
+	:param end: datetime - last date of the window
+	:return: dict with the name and the x/y payload of every trace
+	'''
+	key = (dataset.version, item, start, end)
+	payload = traceCache.get(key)
+	if payload is not None:
+		return payload
+	countyStateList = item.split(',')
+	series = dataset.store.window(countyStateList[1], countyStateList[0], start, end)
+	if countyStateList[0] == ROLLUP_COUNTY:
+		name = countyStateList[1]
+	elif (countyStateList[0] in CITIES_NO_COUNTIES):
+		name = countyStateList[0] + ' - ' + countyStateList[1]
+	else:
+		name = countyStateList[0] + ' County - ' + countyStateList[1]
+	payload = {
+		'name': name,
+		'cases': compactTrace(series.date, series.cases),
+		'deaths': compactTrace(series.date, series.deaths),
+		'new_cases': compactTrace(series.date, series.new_cases.astype(np.int64)),
+		'new_deaths': compactTrace(series.date, series.new_deaths.astype(np.int64)),
+		'avg7_cases': compactTrace(series.date, series.avg7_cases, AVERAGE_DECIMALS),
+		'avg14_cases': compactTrace(series.date, series.avg14_cases, AVERAGE_DECIMALS),
+		'avg7_deaths': compactTrace(series.date, series.avg7_deaths, AVERAGE_DECIMALS),
+		'avg14_deaths': compactTrace(series.date, series.avg14_deaths, AVERAGE_DECIMALS),
+		'mortality': compactTrace(series.date, series.mortality, MORTALITY_DECIMALS),
+		'trend': None,
+	}
+	# least-squares line through the two weeks up to the end of the window, drawn no further back than
+	# the window starts (and so than the series has data, which is also what the fit used)
+	if len(series.date) and np.isfinite(series.slope14[-1]):
+		slope, last = float(series.slope14[-1]), float(series.trend14[-1])
+		first = max(series.date[0], series.date[-1] - (TREND_DAYS - 1))
+		span = int((series.date[-1] - first).astype(np.int64))
+		payload['trend'] = {
+			'x': [str(first), str(series.date[-1])],
+			'y': [round(last - slope * span), round(last)],
+		}
+	traceCache.put(key, payload)
+	return payload
+
+
+def zoomWindow(relayoutData):
+	'''
+	the x range a graph was zoomed to
+	:param relayoutData: dict - relayoutData of a graph
+	:return: tuple (start, end) of datetimes, or None when the graph was reset to its full range
+	'''
+	if not relayoutData or relayoutData.get('xaxis.autorange'):
+		return None
+	if 'xaxis.range[0]' in relayoutData:
+		zoom = [relayoutData['xaxis.range[0]'], relayoutData['xaxis.range[1]']]
+	elif 'xaxis.range' in relayoutData:
+		zoom = relayoutData['xaxis.range']
+	else:
+		# resizes and other layout changes don't need new data
+		raise PreventUpdate
+	return tuple(datetime.strptime(str(value)[:10], '%Y-%m-%d') for value in zoom)
+
+
+# update dashboard; zooming any graph fetches the zoomed window again at full resolution
 @app.callback(
 	[
 		Output('my_graph','figure'),
-		Output('mortality_graph', 'figure')
+		Output('daily_graph', 'figure'),
+		Output('mortality_graph', 'figure'),
+		Output('saved-data', 'children')
+	],
+	[
+		Input('submit-button','n_clicks'),
+		Input('my_graph', 'relayoutData'),
+		Input('daily_graph', 'relayoutData'),
+		Input('mortality_graph', 'relayoutData'),
+		Input('data-version', 'children')
 	],
-	[Input('submit-button','n_clicks')],
 	[
 		State('state_county_picker','value'),
 		State('my_date_picker', 'start_date'),
@@ -217,32 +360,59 @@ def refresh_covid_data(n):
 		State('saved-data', 'children')
 	]
 )
-def update_graph(n_clicks, state_county, start_date, end_date, saved_df_json):
-	start = datetime.strptime(start_date[:10], '%Y-%m-%d')
-	end = datetime.strptime(end_date[:10], '%Y-%m-%d')
-	# read saved df json
-	# covid = pd.read_json(saved_df_json, dtype=COVID_DTYPES)
+@timed('update_graph')
+def update_graph(n_clicks, graphRelayout, dailyRelayout, mortalityRelayout, dataVersion, state_county, start_date, end_date, saved_df_json):
+	refresher.start()
+	dataset = refresher.current
+	if dataset is None:
+		raise PreventUpdate
+	trigger = dash.callback_context.triggered[0]['prop_id'] if dash.callback_context.triggered else ''
+	# zooms and new data redraw what was last submitted; a submit (or the first load) saves the picker state
+	if trigger.startswith('submit-button.') or not saved_df_json:
+		saved_df_json = json.dumps({'counties': state_county or [], 'start': start_date[:10], 'end': end_date[:10]})
+		saved = saved_df_json
+	else:
+		saved = dash.no_update
+	submitted = json.loads(saved_df_json)
+	state_county = submitted['counties']
+	start = datetime.strptime(submitted['start'], '%Y-%m-%d')
+	end = datetime.strptime(submitted['end'], '%Y-%m-%d')
+	xaxis = {}
+	if trigger.endswith('.relayoutData'):
+		relayouts = {'my_graph': graphRelayout, 'daily_graph': dailyRelayout, 'mortality_graph': mortalityRelayout}
+		zoom = zoomWindow(relayouts[trigger.split('.')[0]])
+		if zoom is not None:
+			xaxis = {'range': [zoom[0].strftime('%Y-%m-%d'), zoom[1].strftime('%Y-%m-%d')]}
+			start, end = max(start, zoom[0]), min(end, zoom[1])
+	traceCache.setVersion(dataset.version)
+	figureCache.setVersion(dataset.version)
+	figureKey = (dataset.version, tuple(state_county), start, end, str(xaxis))
+	figures = figureCache.get(figureKey)
+	if figures is not None:
+		return figures + (saved,)
+
 	#create traces for each item in state_county
-	#TODO: add a trendline for the past two weeks
 	traces = []
+	tracesDaily = []
 	tracesMortality= []
 	tracesBase100= []
 	tracesDelta = []
 	titleNames= []
 	colorTracker = 0
 	for item in state_county:
-		countyStateList = item.split(',')
-		df = covid[(covid['date'] >= start) & (covid['date']<= end)]
-		df = df[(df['state'] == countyStateList[1]) & (df['county'] == countyStateList[0])]
-		df['mortality rate'] = df['deaths'] / df['cases']
-		# print(df.head())
-		if (countyStateList[0] in CITIES_NO_COUNTIES):
-			name = countyStateList[0] + ' - ' + countyStateList[1]
-		else:
-			name = countyStateList[0] + ' County - ' + countyStateList[1]
-		traces.append({'x':df['date'], 'y':df['cases'], 'name': name + ' Cases', 'line': dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN])})
-		traces.append({'x':df['date'], 'y':df['deaths'], 'name': name + ' Deaths', 'line': dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN], dash='dash')})
-		tracesMortality.append({'x':df['date'], 'y':df['mortality rate'], 'name': name + ' Mortality', 'line': dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN])})
+		series = countySeries(dataset, item, start, end)
+		name = series['name']
+		traces.append(dict(series['cases'], name=name + ' Cases', line=dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN])))
+		traces.append(dict(series['deaths'], name=name + ' Deaths', line=dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN], dash='dash')))
+		if series['trend'] is not None:
+			traces.append(dict(series['trend'], name=name + ' 14-day Trend', mode='lines', line=dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN], dash='dot')))
+		# daily counts faintly, their 7-day average on top and the 14-day average in the legend; deaths in the lower panel
+		for kind, yaxis in (('cases', 'y'), ('deaths', 'y2')):
+			color = COLOR_LIST[colorTracker % COLOR_LIST_LEN]
+			tracesDaily.append(dict(series['new_' + kind], name=name + ' New ' + kind.capitalize(), yaxis=yaxis, legendgroup=name, opacity=0.35, line=dict(color=color, width=1)))
+			tracesDaily.append(dict(series['avg7_' + kind], name=name + ' New ' + kind.capitalize() + ' (7-day avg)', yaxis=yaxis, legendgroup=name, line=dict(color=color)))
+			tracesDaily.append(dict(series['avg14_' + kind], name=name + ' New ' + kind.capitalize() + ' (14-day avg)', yaxis=yaxis, legendgroup=name, visible='legendonly', line=dict(color=color, dash='dot')))
+		tracesMortality.append(dict(series['mortality'], name=name + ' Mortality', line=dict(color=COLOR_LIST[colorTracker % COLOR_LIST_LEN])))
 		titleNames.append(name)
 		colorTracker += 1
 
@@ -250,16 +420,24 @@ def update_graph(n_clicks, state_county, start_date, end_date, saved_df_json):
 
 	fig = {
 		'data': traces,
-		'layout': {'title': "Cases and Deaths", 'height': 400}
+		'layout': {'title': "Cases and Deaths", 'height': 400, 'xaxis': dict(xaxis, type='date')}
+	}
+
+	figDaily = {
+		'data': tracesDaily,
+		'layout': {
+			'title': "New Cases and Deaths per Day", 'height': 400, 'xaxis': dict(xaxis, type='date'),
+			'yaxis': {'domain': [0.38, 1], 'title': 'Cases'}, 'yaxis2': {'domain': [0, 0.3], 'title': 'Deaths'},
+		}
 	}
 
 	figMortality = {
 		'data': tracesMortality,
-		'layout': {'title': "Mortality Rate", 'showlegend':True, 'height': 275}
+		'layout': {'title': "Mortality Rate", 'showlegend':True, 'height': 275, 'xaxis': dict(xaxis, type='date')}
 
 	}
-	return fig, figMortality
-
+	figureCache.put(figureKey, (fig, figDaily, figMortality))
+	return fig, figDaily, figMortality, saved
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+"""
+Memoization of per-county traces and whole figures.
+
+Entries are keyed by the dataset version, so a refresh never serves stale figures, and the cache
+drops everything it holds as soon as it sees a newer version. Eviction is least-recently-used,
+bounded by the approximate number of bytes held rather than by the number of entries.
+
+"""
+from collections import OrderedDict
+import os
+import sys
+import threading
+
+import numpy as np
+
+FIGURE_CACHE_BYTES = int(os.environ.get('COVID_FIGURE_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+def sizeOf(value):
+	'''
+	approximate memory held by a cached value: array buffers plus the containers around them
+	:param value: nested dicts, lists, tuples, numpy arrays and scalars
+	:return: int - bytes
+	'''
+	if isinstance(value, np.ndarray):
+		return value.nbytes + sys.getsizeof(value)
+	if isinstance(value, dict):
+		return sys.getsizeof(value) + sum(sizeOf(k) + sizeOf(v) for k, v in value.items())
+	if isinstance(value, (list, tuple)):
+		if value and isinstance(value[0], (dict, list, tuple, np.ndarray)):
+			return sys.getsizeof(value) + sum(sizeOf(v) for v in value)
+		# lists of numbers or date strings: every element is about the size of the first
+		return sys.getsizeof(value) + (len(value) * sys.getsizeof(value[0]) if value else 0)
+	return sys.getsizeof(value)
+
+
+class LRUCache:
+	'''
+	thread-safe LRU cache bounded by size in bytes, cleared whenever the dataset version changes
+	'''
+
+	def __init__(self, maxBytes=FIGURE_CACHE_BYTES):
+		self.maxBytes = maxBytes
+		self.bytes = 0
+		self.version = None
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def setVersion(self, version):
+		'''
+		drop every entry if the dataset has moved on to a newer version
+		:param version: int - version of the dataset the next lookups are for
+		'''
+		with self._lock:
+			# a request still holding the previous dataset must not wipe entries for the new one
+			if self.version is None or version > self.version:
+				self._entries.clear()
+				self.bytes = 0
+				self.version = version
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.bytes = 0
+
+	def get(self, key):
+		'''
+		:return: the cached value, or None on a miss
+		'''
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def put(self, key, value):
+		'''
+		cache a value, evicting the least recently used entries to stay under maxBytes
+		'''
+		size = sizeOf(value)
+		if size > self.maxBytes:
+			return
+		with self._lock:
+			old = self._entries.pop(key, None)
+			if old is not None:
+				self.bytes -= old[1]
+			self._entries[key] = (value, size)
+			self.bytes += size
+			while self.bytes > self.maxBytes:
+				_, (_, evictedSize) = self._entries.popitem(last=False)
+				self.bytes -= evictedSize
+				self.evictions += 1
+
+	def stats(self):
+		'''
+		:return: dict of hit, miss and eviction counters and current size
+		'''
+		with self._lock:
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'entries': len(self._entries),
+				'bytes': self.bytes,
+				'max_bytes': self.maxBytes,
+			}
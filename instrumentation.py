@@ -0,0 +1,258 @@
+"""
+Lightweight metrics and profiling for the dashboard's flask server.
+
+Counters, gauges and histograms are kept in memory per process and rendered in the Prometheus text
+format on /metrics. Recording a value is a lock and a bisect, so the instrumentation stays on in
+production. Every gunicorn worker keeps its own numbers; each scrape reports the worker that
+answered it.
+
+A sampling profiler can be switched on for single requests: start the app with COVID_PROFILING=1
+and send a request with the header `X-Profile: 1`. The request thread's stack is sampled every
+PROFILE_INTERVAL seconds, and the folded stacks (flamegraph.pl / speedscope format) are written to
+PROFILE_DIR. The file name is returned in the `X-Profile-File` response header.
+
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import os
+import sys
+import threading
+import time
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, request
+
+PROFILING = os.environ.get('COVID_PROFILING', '') == '1'
+PROFILE_DIR = os.environ.get('COVID_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.profiles'))
+PROFILE_INTERVAL = float(os.environ.get('COVID_PROFILE_INTERVAL', 0.005))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REGISTRY = []
+
+
+def _escape(value):
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labelText(labelNames, labelValues, extra=''):
+	pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelNames, labelValues)]
+	if extra:
+		pairs.append(extra)
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+	'''
+	a named metric with optional labels, registered for /metrics; counters and gauges can instead be
+	read at scrape time from fn() returning {label values tuple: value}
+	'''
+	kind = None
+
+	def __init__(self, name, documentation, labelNames=(), fn=None):
+		self.name = name
+		self.documentation = documentation
+		self.labelNames = tuple(labelNames)
+		self.fn = fn
+		self._values = {}
+		self._lock = threading.Lock()
+		REGISTRY.append(self)
+
+	def _key(self, labels):
+		return tuple(str(labels[name]) for name in self.labelNames)
+
+	def samples(self):
+		'''
+		:return: list of (suffix, label text, value) lines of this metric
+		'''
+		if self.fn is not None:
+			values = self.fn()
+		else:
+			with self._lock:
+				values = dict(self._values)
+		return [('', _labelText(self.labelNames, key), value) for key, value in values.items()]
+
+	def render(self):
+		lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+		for suffix, labels, value in self.samples():
+			lines.append(f'{self.name}{suffix}{labels} {value}')
+		return '\n'.join(lines)
+
+
+class Counter(Metric):
+	kind = 'counter'
+
+	def inc(self, amount=1, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+	kind = 'gauge'
+
+	def set(self, value, **labels):
+		key = self._key(labels)
+		with self._lock:
+			self._values[key] = value
+
+
+class Histogram(Metric):
+	kind = 'histogram'
+
+	def __init__(self, name, documentation, labelNames=(), buckets=LATENCY_BUCKETS):
+		super().__init__(name, documentation, labelNames)
+		self.buckets = tuple(buckets)
+
+	def observe(self, value, **labels):
+		key = self._key(labels)
+		i = bisect_left(self.buckets, value)
+		with self._lock:
+			counts = self._values.get(key)
+			if counts is None:
+				# one count per bucket plus +Inf, then the sum
+				counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+			counts[i] += 1
+			counts[-1] += value
+
+	@contextmanager
+	def time(self, **labels):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start, **labels)
+
+	def samples(self):
+		lines = []
+		with self._lock:
+			items = [(key, list(counts)) for key, counts in self._values.items()]
+		for key, counts in items:
+			cumulative = 0
+			for bound, count in zip(self.buckets + ('+Inf',), counts):
+				cumulative += count
+				lines.append(('_bucket', _labelText(self.labelNames, key, f'le="{bound}"'), cumulative))
+			lines.append(('_count', _labelText(self.labelNames, key), cumulative))
+			lines.append(('_sum', _labelText(self.labelNames, key), counts[-1]))
+		return lines
+
+
+CALLBACK_SECONDS = Histogram('covid_callback_seconds', 'Latency of dash callbacks.', ['callback'])
+CALLBACK_ERRORS = Counter('covid_callback_errors_total', 'Dash callbacks that raised, excluding PreventUpdate.', ['callback'])
+DATA_LOAD_SECONDS = Histogram('covid_data_load_seconds', 'Time spent loading data, by phase.', ['phase'])
+RESPONSE_BYTES = Histogram('covid_response_bytes', 'Size of http responses, by route.', ['route'], buckets=SIZE_BUCKETS)
+
+
+def timed(callback):
+	'''
+	decorator recording a dash callback's latency in CALLBACK_SECONDS; put it under @app.callback
+	:param callback: string - label of the callback
+	'''
+	def decorator(fn):
+		@wraps(fn)
+		def wrapper(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return fn(*args, **kwargs)
+			except PreventUpdate:
+				raise
+			except Exception:
+				CALLBACK_ERRORS.inc(callback=callback)
+				raise
+			finally:
+				CALLBACK_SECONDS.observe(time.perf_counter() - start, callback=callback)
+		return wrapper
+	return decorator
+
+
+def render():
+	'''
+	:return: string - every registered metric in the Prometheus text format
+	'''
+	return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+class Sampler:
+	'''
+	samples one thread's python stack at a fixed interval and counts the folded stacks
+	'''
+
+	def __init__(self, threadId, interval=PROFILE_INTERVAL):
+		self.threadId = threadId
+		self.interval = interval
+		self.stacks = {}
+		self._stopped = threading.Event()
+		self._thread = threading.Thread(target=self._run, name='covid-profiler', daemon=True)
+
+	def _run(self):
+		while not self._stopped.wait(self.interval):
+			frame = sys._current_frames().get(self.threadId)
+			names = []
+			while frame is not None:
+				code = frame.f_code
+				names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+				frame = frame.f_back
+			if names:
+				stack = ';'.join(reversed(names))
+				self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+	def start(self):
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stopped.set()
+		self._thread.join()
+
+	def write(self, path):
+		with open(path, 'w') as f:
+			for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+				f.write(f'{stack} {count}\n')
+
+
+def _route(callbackMap):
+	# every dash callback posts to the same url, so label them by their outputs instead; the body is
+	# client-controlled, so only outputs of registered callbacks become labels
+	if request.path == '/_dash-update-component':
+		body = request.get_json(silent=True)
+		output = body.get('output') if isinstance(body, dict) else None
+		return output if isinstance(output, str) and output in callbackMap else 'dash-unknown'
+	return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def instrument(dashApp):
+	'''
+	add /metrics, response size tracking and the opt-in profiler to a dash app's flask server
+	:param dashApp: dash.Dash - its callback_map names the callbacks response sizes are labelled with
+	'''
+	server = dashApp.server
+
+	@server.route('/metrics')
+	def metrics():
+		return Response(render(), mimetype='text/plain; version=0.0.4')
+
+	@server.before_request
+	def startProfiler():
+		if PROFILING and request.headers.get('X-Profile') == '1':
+			g.sampler = Sampler(threading.get_ident()).start()
+
+	@server.after_request
+	def recordResponse(response):
+		if not response.direct_passthrough and response.content_length is not None:
+			RESPONSE_BYTES.observe(response.content_length, route=_route(dashApp.callback_map))
+		sampler = g.pop('sampler', None)
+		if sampler is not None:
+			sampler.stop()
+			os.makedirs(PROFILE_DIR, exist_ok=True)
+			path = os.path.join(PROFILE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{threading.get_ident()}.folded')
+			sampler.write(path)
+			response.headers['X-Profile-File'] = os.path.basename(path)
+		return response
+
+	@server.teardown_request
+	def stopProfiler(exception):
+		sampler = g.pop('sampler', None)
+		if sampler is not None:
+			sampler.stop()
@@ -0,0 +1,121 @@
+"""
+Compact plotly trace payloads.
+
+A daily series is sent as a start date plus a one-day step (x0/dx) instead of a list of
+timestamps, integer series as plain ints and rates rounded to a few decimals. Series longer than
+the graph can show are downsampled with largest-triangle-three-buckets (LTTB), which keeps peaks
+and turning points; zooming in asks for the narrower window again at full resolution.
+
+The kept points are no longer evenly spaced and need an explicit date each, so downsampling only
+pays off for series several times longer than MAX_POINTS; shorter ones are sent whole.
+
+"""
+import base64
+import json
+import os
+
+import numpy as np
+
+DAY_MS = 86400000
+# about one point per horizontal pixel of the graphs
+MAX_POINTS = int(os.environ.get('COVID_MAX_POINTS', 800))
+MORTALITY_DECIMALS = 5
+AVERAGE_DECIMALS = 1
+# base64 typed arrays ({'dtype', 'bdata'}) are smaller still, but need plotly.js 2.28 or newer
+TYPED_ARRAYS = os.environ.get('COVID_TYPED_ARRAYS', '') == '1'
+# json size of one explicit x value: '"2020-01-21",'
+DATE_BYTES = 13
+
+
+def lttb(x, y, threshold):
+	'''
+	largest-triangle-three-buckets downsampling
+	:param x: numpy array - increasing x values
+	:param y: numpy array - y values, without nan
+	:param threshold: int - number of points to keep, at least 3
+	:return: numpy array of the indices of the kept points, first and last included
+	'''
+	n = len(x)
+	if threshold >= n or threshold < 3:
+		return np.arange(n)
+	# buckets hold only a couple of points each at dashboard sizes, so plain python over lists is
+	# much faster than numpy calls on tiny slices
+	x = np.asarray(x, dtype=np.float64).tolist()
+	y = np.asarray(y, dtype=np.float64).tolist()
+	# the first and last point are kept, the rest is split into threshold - 2 buckets
+	edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64).tolist()
+	keep = [0]
+	a = 0
+	for i in range(threshold - 2):
+		lo, hi = edges[i], edges[i + 1]
+		# average of the next bucket, or the last point for the last bucket
+		if i + 2 < len(edges):
+			nextLo, nextHi = edges[i + 1], edges[i + 2]
+			avgX = sum(x[nextLo:nextHi]) / (nextHi - nextLo)
+			avgY = sum(y[nextLo:nextHi]) / (nextHi - nextLo)
+		else:
+			avgX, avgY = x[n - 1], y[n - 1]
+		ax, ay = x[a], y[a]
+		best, bestArea = lo, -1.0
+		for j in range(lo, hi):
+			area = abs((ax - avgX) * (y[j] - ay) - (ax - x[j]) * (avgY - ay))
+			if area > bestArea:
+				best, bestArea = j, area
+		a = best
+		keep.append(a)
+	keep.append(n - 1)
+	return np.array(keep, dtype=np.int64)
+
+
+def encodeValues(values, decimals=None):
+	'''
+	:param values: numpy array - y values
+	:param decimals: int - round floats to this many decimals; None for integer series
+	:return: list (nan and inf as None) or a typed-array spec if TYPED_ARRAYS is on
+	'''
+	if TYPED_ARRAYS:
+		if decimals is None:
+			values = np.ascontiguousarray(values, dtype='<i4')
+			dtype = 'i4'
+		else:
+			values = np.ascontiguousarray(values, dtype='<f4')
+			dtype = 'f4'
+		return {'dtype': dtype, 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+	if decimals is None:
+		return values.tolist()
+	# float32 columns are widened first so rounding gives short decimal reprs in the json
+	values = np.round(values.astype(np.float64), decimals)
+	return np.where(np.isfinite(values), values, None).tolist()
+
+
+def compactTrace(date, values, decimals=None, maxPoints=MAX_POINTS):
+	'''
+	x and y of one trace, downsampled to maxPoints when longer
+	:param date: numpy datetime64[D] array - dates of the series
+	:param values: numpy array - y values
+	:param decimals: int - round floats to this many decimals; None for integer series
+	:param maxPoints: int - most points to send
+	:return: dict with either x0/dx or x, and y
+	'''
+	if len(date) == 0:
+		return {'x': [], 'y': []}
+	trace = {'y': encodeValues(values, decimals)}
+	if int((date[-1] - date[0]).astype(np.int64)) == len(date) - 1:
+		trace['x0'] = str(date[0])
+		trace['dx'] = DAY_MS
+	else:
+		trace['x'] = np.datetime_as_string(date, unit='D').tolist()
+	if len(date) <= maxPoints:
+		return trace
+	# estimate the downsampled size from the bytes per point of the full trace, plus an explicit date
+	# per point if the full trace didn't already have them; only downsample when that is smaller
+	fullBytes = len(json.dumps(trace))
+	perPoint = fullBytes / len(date) + (DATE_BYTES if 'x0' in trace else 0)
+	if maxPoints * perPoint >= fullBytes:
+		return trace
+	day = date.astype(np.int64)
+	finite = np.isfinite(values)
+	keep = lttb(day[finite], values[finite], maxPoints)
+	date, values = date[finite][keep], values[finite][keep]
+	sampled = {'x': np.datetime_as_string(date, unit='D').tolist(), 'y': encodeValues(values, decimals)}
+	return sampled if len(json.dumps(sampled)) < fullBytes else trace
@@ -0,0 +1,96 @@
+"""
+Options for the state / county picker.
+
+The options are built ahead of time from the county list in stateCounties.py and the Wikipedia
+list of the most populous counties (for city aliases), and saved as a compact json artifact.
+The app only reads that artifact at startup, so importing it needs neither the network nor the
+large stateCountyData string.
+
+Rebuild the artifact with:
+	python pickerOptions.py [--no-cities]
+
+"""
+import json
+import logging
+import os
+import sys
+
+from covidMetrics import NATION, ROLLUP_COUNTY
+
+logger = logging.getLogger(__name__)
+
+PICKER_OPTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pickerOptions.json')
+WIKI_COUNTIES = 'https://en.wikipedia.org/wiki/List_of_the_most_populous_counties_in_the_United_States'
+
+# the NYT reports these as one area instead of by county
+CITIES_NO_COUNTIES = ['New York City', 'Kansas City']
+
+
+def buildPickerData(includeCities=True):
+	'''
+	build the compact picker data from the county list and, optionally, the wikipedia city table
+	:param includeCities: bool - scrape wikipedia for 'city, state' aliases of the largest counties
+	:return: dict with 'counties': [[county, state], ...] and 'cities': [[city, county, state], ...]
+	'''
+	from stateCounties import stateCountyData
+
+	stateCounty = json.loads(stateCountyData)
+	counties = [[stateCounty['county'][key], stateCounty['state'][key]] for key in stateCounty['county']]
+
+	cities = []
+	if includeCities:
+		import pandas as pd
+
+		table = pd.read_html(WIKI_COUNTIES, header=1)[0].dropna()
+		table = table[~(table['County seat'].str.contains('NYC'))]
+		table = table[~(table['County seat'].str.contains('Kansas City'))]
+		cities = [[seat, county, state] for seat, county, state in zip(table['County seat'], table['County'], table['State'])]
+	return {'counties': counties, 'cities': cities}
+
+
+def writePickerData(data, path=PICKER_OPTIONS_PATH):
+	tmp = path + '.tmp'
+	with open(tmp, 'w') as f:
+		json.dump(data, f, separators=(',', ':'))
+	os.replace(tmp, path)
+
+
+def toOptions(data):
+	'''
+	expand the compact picker data into dropdown options
+	:param data: dict - output of buildPickerData
+	:return: list of {'label': 'user sees', 'value': 'county,state'}
+	'''
+	options = []
+	for county, state in data['counties']:
+		if county in CITIES_NO_COUNTIES:
+			label = county + ', ' + state
+		else:
+			label = county + ' County, ' + state
+		options.append({'label': label, 'value': county + ',' + state})
+	# us cities: 'label': 'city, state', 'value': 'county, state'
+	for city, county, state in data['cities']:
+		options.append({'label': city + ', ' + state, 'value': county + ',' + state})
+	# state and national totals are the rollup series computed with the metrics
+	for state in [NATION] + sorted({state for _, state in data['counties']}):
+		options.append({'label': state + ' (all counties)', 'value': ROLLUP_COUNTY + ',' + state})
+	return options
+
+
+def loadPickerOptions(path=PICKER_OPTIONS_PATH):
+	'''
+	load the prebuilt picker options, falling back to the county list without city aliases
+	:param path: string - artifact written by writePickerData
+	:return: list of dropdown options
+	'''
+	try:
+		with open(path) as f:
+			data = json.load(f)
+	except OSError:
+		logger.warning('%s is missing, city aliases are unavailable; run pickerOptions.py to build it', path)
+		data = buildPickerData(includeCities=False)
+	return toOptions(data)
+
+
+if __name__ == '__main__':
+	writePickerData(buildPickerData(includeCities='--no-cities' not in sys.argv[1:]))
@@ -0,0 +1,201 @@
+"""
+Read-only columnar snapshots of the county data, shared by every worker through mmap.
+
+A snapshot is a directory of .npy files written once by the refreshing process:
+- county, state and fips are dictionary-encoded int32 codes, the dictionaries live in dictionaries.json
+- date is an int32 day offset from EPOCH
+- cases and deaths are int32
+- any other column (the derived metrics) is float32
+- rows are sorted by state, county and date, and groupStart/groupStop hold each county's row range
+- small precomputed tables (e.g. the top movers) are kept as json in tables.json
+
+Snapshots are versioned by directory name and never modified, so workers can keep mapping an old
+one while a refresh writes the next. writeSnapshot encodes a whole dataframe; extendSnapshot writes
+the next version by merging a few new rows into the columns of the previous one.
+
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+EPOCH = np.datetime64('2020-01-01', 'D')
+COLUMNS = ['date', 'county', 'state', 'fips', 'cases', 'deaths']
+DICTIONARY_COLUMNS = ['county', 'state', 'fips']
+KEEP_SNAPSHOTS = 2
+# bumped whenever the set of columns changes, so caches from an older release are rebuilt
+SNAPSHOT_FORMAT = 4
+
+
+def toDays(date):
+	'''
+	:param date: datetime, string or datetime64 - a date
+	:return: int - days since EPOCH
+	'''
+	return int((np.datetime64(date, 'D') - EPOCH).astype(np.int64))
+
+
+def snapshotPath(root, version):
+	return os.path.join(root, f'v{version:08d}')
+
+
+def writeSnapshot(df, root, version, tables=None):
+	'''
+	write a dataframe as a new snapshot version and remove versions older than the previous one
+	:param df: dataframe with the COVID_DTYPES columns, a date column and optional float metric columns
+	:param root: string - directory holding the snapshot versions
+	:param version: int - version of the new snapshot
+	:param tables: dict - json-serializable tables stored alongside the columns
+	:return: string - path of the new snapshot
+	'''
+	dictionaries = {}
+	codes = {}
+	for col in DICTIONARY_COLUMNS:
+		# missing values (e.g. the fips of New York City) get code -1
+		codes[col], uniques = pd.factorize(df[col], sort=True)
+		dictionaries[col] = [str(value) for value in uniques]
+	day = ((df['date'].to_numpy(dtype='datetime64[D]') - EPOCH).astype(np.int32))
+
+	order = np.lexsort((day, codes['county'], codes['state']))
+	columns = {
+		'county': codes['county'][order].astype(np.int32),
+		'state': codes['state'][order].astype(np.int32),
+		'fips': codes['fips'][order].astype(np.int32),
+		'date': day[order],
+		'cases': df['cases'].to_numpy()[order].astype(np.int32),
+		'deaths': df['deaths'].to_numpy()[order].astype(np.int32),
+	}
+	for col in df.columns:
+		if col not in COLUMNS:
+			columns[col] = df[col].to_numpy(dtype=np.float32)[order]
+	return _write(columns, dictionaries, tables, root, version)
+
+
+def extendSnapshot(snapshot, df, root, version, tables=None):
+	'''
+	write a new snapshot version holding the rows of an existing one plus new rows
+	:param snapshot: Snapshot - previous version
+	:param df: dataframe with the same columns as the snapshot, for dates after the snapshot's last date of each series
+	:param root: string - directory holding the snapshot versions
+	:param version: int - version of the new snapshot
+	:param tables: dict - json-serializable tables stored alongside the columns
+	:return: string - path of the new snapshot
+	'''
+	dictionaries = {}
+	oldCodes = {}
+	newCodes = {}
+	for col in DICTIONARY_COLUMNS:
+		old = snapshot.dictionaries[col]
+		values = sorted(set(old).union(str(value) for value in df[col].dropna().unique()))
+		dictionaries[col] = values
+		lookup = {value: code for code, value in enumerate(values)}
+		# codes of new values shift the sorted dictionary; -1 (missing) indexes the appended -1
+		remap = np.array([lookup[value] for value in old] + [-1], dtype=np.int32)
+		oldCodes[col] = remap[snapshot[col]]
+		newCodes[col] = df[col].map(lookup).fillna(-1).to_numpy(dtype=np.int32)
+	day = ((df['date'].to_numpy(dtype='datetime64[D]') - EPOCH).astype(np.int32))
+
+	# rows stay sorted by state, county and date: each new row goes after the existing rows of its
+	# series, or where its series sorts if it is a new one
+	width = len(dictionaries['county'])
+	oldKey = oldCodes['state'].astype(np.int64) * width + oldCodes['county']
+	newKey = newCodes['state'].astype(np.int64) * width + newCodes['county']
+	order = np.lexsort((day, newKey))
+	at = np.searchsorted(oldKey, newKey[order], side='right')
+	added = {
+		'date': day,
+		'cases': df['cases'].to_numpy(),
+		'deaths': df['deaths'].to_numpy(),
+	}
+	added.update(newCodes)
+	columns = {}
+	for name, values in snapshot.columns.items():
+		if name in ('groupStart', 'groupStop'):
+			continue
+		old = oldCodes.get(name, values)
+		new = added[name] if name in added else df[name].to_numpy(dtype=np.float32)
+		columns[name] = np.insert(old, at, new[order].astype(values.dtype))
+	return _write(columns, dictionaries, tables, root, version)
+
+
+def _write(columns, dictionaries, tables, root, version):
+	path = snapshotPath(root, version)
+	tmp = path + f'.{os.getpid()}.tmp'
+	os.makedirs(tmp)
+
+	state, county = columns['state'], columns['county']
+	change = np.flatnonzero((state[1:] != state[:-1]) | (county[1:] != county[:-1])) + 1
+	columns['groupStart'] = np.concatenate([[0], change]).astype(np.int64) if len(state) else np.zeros(0, np.int64)
+	columns['groupStop'] = np.concatenate([change, [len(state)]]).astype(np.int64) if len(state) else np.zeros(0, np.int64)
+
+	for name, values in columns.items():
+		np.save(os.path.join(tmp, name + '.npy'), values)
+	with open(os.path.join(tmp, 'dictionaries.json'), 'w') as f:
+		json.dump(dictionaries, f)
+	with open(os.path.join(tmp, 'tables.json'), 'w') as f:
+		json.dump(tables or {}, f)
+	if os.path.exists(path):  # left over from a cache whose metadata was lost
+		shutil.rmtree(path)
+	os.replace(tmp, path)
+
+	# workers still mapping a removed version keep their open files, so only very old ones are dropped
+	for name in os.listdir(root):
+		if name.startswith('v') and name[1:].isdigit() and int(name[1:]) <= version - KEEP_SNAPSHOTS:
+			shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+	return path
+
+
+class Snapshot:
+	'''
+	memory-mapped view of one snapshot version
+	'''
+
+	def __init__(self, path):
+		self.path = path
+		with open(os.path.join(path, 'dictionaries.json')) as f:
+			self.dictionaries = json.load(f)
+		with open(os.path.join(path, 'tables.json')) as f:
+			self.tables = json.load(f)
+		self.columns = {}
+		for name in os.listdir(path):
+			if name.endswith('.npy'):
+				self.columns[name[:-len('.npy')]] = np.load(os.path.join(path, name), mmap_mode='r')
+
+	def __len__(self):
+		return len(self.columns['date'])
+
+	def __getitem__(self, name):
+		return self.columns[name]
+
+	def groups(self):
+		'''
+		:return: dict key = (state, county), val = (first row, row after the last)
+		'''
+		states, counties = self.dictionaries['state'], self.dictionaries['county']
+		start, stop = self['groupStart'], self['groupStop']
+		state, county = self['state'][start], self['county'][start]
+		return {
+			(states[s], counties[c]): (int(lo), int(hi))
+			for s, c, lo, hi in zip(state.tolist(), county.tolist(), start.tolist(), stop.tolist())
+		}
+
+	def tail(self, rows):
+		'''
+		decode the last rows of every series, the context the refresher needs to compute appended days
+		:param rows: int - rows per series
+		:return: dataframe with the readToDf columns, rollups included
+		'''
+		start, stop = self['groupStart'], self['groupStop']
+		first = np.maximum(start, stop - rows)
+		lengths = stop - first
+		# row numbers first[g], first[g] + 1, ..., stop[g] - 1 of every series g, without a python loop
+		index = np.arange(lengths.sum()) + np.repeat(first - np.cumsum(lengths) + lengths, lengths)
+		df = pd.DataFrame({'date': (EPOCH + self['date'][index].astype('timedelta64[D]')).astype('datetime64[ns]')})
+		for col in DICTIONARY_COLUMNS:
+			df[col] = pd.Categorical.from_codes(self[col][index], self.dictionaries[col]).astype(object)
+		df['cases'] = self['cases'][index].astype(np.int64)
+		df['deaths'] = self['deaths'][index].astype(np.int64)
+		return df[COLUMNS]
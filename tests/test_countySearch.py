@@ -0,0 +1,46 @@
+from countySearch import PrefixIndex
+
+OPTIONS = [
+	{'label': 'Hudson County, New Jersey', 'value': 'Hudson,New Jersey'},
+	{'label': 'Essex County, New Jersey', 'value': 'Essex,New Jersey'},
+	{'label': 'Essex County, Massachusetts', 'value': 'Essex,Massachusetts'},
+	{'label': 'Jersey County, Illinois', 'value': 'Jersey,Illinois'},
+	{'label': 'Newark, New Jersey', 'value': 'Essex,New Jersey'},
+	{'label': 'New Jersey (all counties)', 'value': 'All counties,New Jersey'},
+]
+
+
+def labels(options):
+	return [option['label'] for option in options]
+
+
+def test_every_query_word_must_prefix_a_label_word():
+	index = PrefixIndex(OPTIONS)
+	assert labels(index.search('ess jer')) == ['Essex County, New Jersey']
+	assert labels(index.search('jer ess')) == ['Essex County, New Jersey']
+	assert labels(index.search('ess mass')) == ['Essex County, Massachusetts']
+	assert index.search('ess illinois') == []
+	assert index.search('sex') == []
+	assert index.search('  ') == []
+
+
+def test_labels_starting_with_the_query_come_first_then_shorter_ones():
+	index = PrefixIndex(OPTIONS)
+	assert labels(index.search('jersey')) == [
+		'Jersey County, Illinois', 'Newark, New Jersey', 'Hudson County, New Jersey', 'New Jersey (all counties)',
+	]
+	assert labels(index.search('new jersey')) == ['New Jersey (all counties)', 'Newark, New Jersey', 'Hudson County, New Jersey']
+
+
+def test_options_sharing_a_value_are_returned_once():
+	index = PrefixIndex(OPTIONS)
+	# Newark is an alias of Essex County, New Jersey: only the better ranked of the two is returned
+	assert labels(index.search('new')) == ['Newark, New Jersey', 'New Jersey (all counties)', 'Hudson County, New Jersey']
+	assert labels(index.search('essex')) == ['Essex County, New Jersey', 'Essex County, Massachusetts']
+	# chips of selected values show the county's label
+	assert index.byValue['Essex,New Jersey']['label'] == 'Essex County, New Jersey'
+
+
+def test_results_are_capped():
+	index = PrefixIndex(OPTIONS)
+	assert len(index.search('county', limit=2)) == 2
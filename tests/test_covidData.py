@@ -0,0 +1,100 @@
+import logging
+import os
+import shutil
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generateFrame
+from covidData import DataRefresher, newRowsOffset
+from snapshot import DICTIONARY_COLUMNS
+
+CSV = (
+	b'date,county,state,fips,cases,deaths\n'
+	b'2020-03-01,Hudson,New Jersey,34017,10,0\n'
+	b'2020-03-01,Essex,New Jersey,34013,5,0\n'
+	b'2020-03-02,Hudson,New Jersey,34017,12,1\n'
+)
+NEW_DAY = b'2020-03-03,Hudson,New Jersey,34017,15,1\n'
+
+
+def test_new_rows_start_after_a_pure_append():
+	assert newRowsOffset(CSV + NEW_DAY, '2020-03-02', len(CSV), zlib.crc32(CSV)) == len(CSV)
+	assert newRowsOffset(CSV, '2020-03-02', len(CSV), zlib.crc32(CSV)) == len(CSV)
+
+
+def test_rewritten_rows_need_a_full_parse():
+	# same size, an earlier count revised in place
+	revised = CSV.replace(b',10,0', b',11,0')
+	assert newRowsOffset(revised + NEW_DAY, '2020-03-02', len(CSV), zlib.crc32(CSV)) is None
+	# a row inserted before the last parsed date
+	inserted = CSV.replace(b'2020-03-02,', b'2020-03-01,Bergen,New Jersey,34003,1,0\n2020-03-02,')
+	assert newRowsOffset(inserted + NEW_DAY, '2020-03-02', len(CSV), zlib.crc32(CSV)) is None
+	# the last parsed date is gone
+	assert newRowsOffset(CSV[:CSV.find(b'2020-03-02')], '2020-03-02', len(CSV), zlib.crc32(CSV)) is None
+
+
+def test_nothing_parsed_yet_needs_a_full_parse():
+	assert newRowsOffset(CSV, None, None, None) is None
+	assert newRowsOffset(CSV, '2020-03-02', 0, 0) is None
+
+
+def decoded(dataset):
+	snapshot = dataset.snapshot
+	columns = {}
+	for name, values in snapshot.columns.items():
+		if name in DICTIONARY_COLUMNS:
+			dictionary = snapshot.dictionaries[name]
+			columns[name] = [dictionary[code] if code >= 0 else None for code in values.tolist()]
+		else:
+			columns[name] = np.asarray(values)
+	return columns, snapshot.tables
+
+
+def writeDays(path, df, dates, mode='w'):
+	df[df['date'].isin(dates)].to_csv(path, mode=mode, header=mode == 'w', index=False)
+
+
+def test_incremental_refresh_matches_a_full_refresh(tmp_path, caplog):
+	df = generateFrame(40, 30)
+	dates = sorted(df['date'].unique())
+	# the appended days bring a new county (and fips) and miss one that reported before
+	late = pd.DataFrame({
+		'date': dates[-2:], 'county': 'Aardvark', 'state': 'Alabama', 'fips': '99999', 'cases': [3, 8], 'deaths': [0, 1],
+	})
+	df = pd.concat([df, late], ignore_index=True).sort_values('date', kind='mergesort', ignore_index=True)
+	df = df[~((df['date'] == dates[-1]) & (df['county'] == df['county'].iloc[0]))]
+	csvPath = str(tmp_path / 'us-counties.csv')
+	writeDays(csvPath, df, dates[:-2])
+	incremental = DataRefresher(csvPath, str(tmp_path / 'incremental'))
+	incremental.refresh()
+	for date in dates[-2:]:
+		writeDays(csvPath, df, [date], mode='a')
+		with caplog.at_level(logging.INFO, logger='covidData'):
+			incremental.refresh()
+		assert 'new bytes of covid data' in caplog.text
+		caplog.clear()
+
+	full = DataRefresher(csvPath, str(tmp_path / 'full'))
+	full.refresh()
+	incrementalColumns, incrementalTables = decoded(incremental.current)
+	fullColumns, fullTables = decoded(full.current)
+	assert incrementalColumns.keys() == fullColumns.keys()
+	for name in fullColumns:
+		np.testing.assert_array_equal(incrementalColumns[name], fullColumns[name], err_msg=name)
+	assert incrementalTables == fullTables
+	assert ('Alabama', 'Aardvark') in incremental.current.store
+
+
+def test_unchanged_source_is_fetched_again_when_the_snapshot_is_missing(tmp_path):
+	csvPath = str(tmp_path / 'us-counties.csv')
+	generateFrame(10, 20).to_csv(csvPath, index=False)
+	cacheDir = str(tmp_path / 'cache')
+	DataRefresher(csvPath, cacheDir).refresh()
+	shutil.rmtree(os.path.join(cacheDir, 'snapshots'))
+
+	refresher = DataRefresher(csvPath, cacheDir)
+	assert not refresher.loadCache()
+	refresher.refresh()
+	assert refresher.current is not None
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generateFrame
+from covidMetrics import NATION, ROLLUP_COUNTY, TREND_DAYS, computeMetrics, seriesIndex, topMovers, windowDiff
+
+
+def frame(counties=12, days=40):
+	df = generateFrame(counties, days)
+	df['date'] = pd.to_datetime(df['date'])
+	# a series that starts late, shorter than the trend and weekly windows
+	late = pd.DataFrame({
+		'date': pd.to_datetime(['2020-02-27', '2020-02-28', '2020-02-29']),
+		'county': 'Late', 'state': 'Alaska', 'fips': None, 'cases': [5000, 9000, 12000], 'deaths': [0, 10, 30],
+	})
+	return pd.concat([df[df['county'] != 'Unknown'], late], ignore_index=True)
+
+
+def test_window_diff_matches_rolling_sums():
+	df = computeMetrics(frame())
+	group, position = seriesIndex(df)
+	cases = df['cases'].to_numpy(dtype=np.float64)
+	daily = df.groupby(group)['cases'].diff().fillna(df['cases']).to_numpy()
+	for days in (1, 7, 14):
+		expected = pd.Series(daily).groupby(group).rolling(days, min_periods=1).sum().to_numpy()
+		np.testing.assert_allclose(windowDiff(cases, group, position, days), expected)
+
+
+def test_daily_increases_and_averages_match_pandas():
+	df = computeMetrics(frame())
+	group, _ = seriesIndex(df)
+	for name in ('cases', 'deaths'):
+		daily = df.groupby(group)[name].diff().fillna(df[name])
+		np.testing.assert_allclose(df['new_' + name], daily)
+		for days in (7, 14):
+			expected = daily.groupby(group).rolling(days, min_periods=1).mean().to_numpy()
+			np.testing.assert_allclose(df[f'avg{days}_{name}'], expected)
+
+
+def test_trend_matches_polyfit():
+	df = computeMetrics(frame())
+	for _, series in df.groupby(['state', 'county'], sort=False):
+		cases = series['cases'].to_numpy(dtype=np.float64)
+		for i in range(len(series)):
+			window = cases[max(0, i - TREND_DAYS + 1):i + 1]
+			if len(window) < 2:
+				assert np.isnan(series['slope14'].iloc[i])
+				continue
+			slope, intercept = np.polyfit(np.arange(len(window)), window, 1)
+			np.testing.assert_allclose(series['slope14'].iloc[i], slope, rtol=1e-6, atol=1e-6)
+			np.testing.assert_allclose(series['trend14'].iloc[i], intercept + slope * (len(window) - 1), rtol=1e-6, atol=1e-6)
+
+
+def test_mortality_and_rollups():
+	counties = frame()
+	df = computeMetrics(counties)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		expected = np.where(df['cases'] > 0, df['deaths'] / df['cases'], np.nan)
+	np.testing.assert_allclose(df['mortality'], expected)
+
+	rollups = df[df['county'] == ROLLUP_COUNTY].set_index(['state', 'date'])
+	states = counties.groupby(['state', 'date'])[['cases', 'deaths']].sum()
+	pd.testing.assert_frame_equal(rollups.loc[states.index, ['cases', 'deaths']], states, check_dtype=False)
+	nation = rollups.loc[NATION, ['cases', 'deaths']]
+	pd.testing.assert_frame_equal(nation, counties.groupby('date')[['cases', 'deaths']].sum(), check_dtype=False)
+
+
+def test_top_movers_use_the_actual_increase():
+	counties = frame()
+	tables = topMovers(computeMetrics(counties))
+	last = counties['date'].max()
+	latest = counties[counties['date'] == last].set_index(['state', 'county'])['cases']
+	for table, column, days in (('daily', 'New cases', 1), ('weekly', 'New cases (7 days)', 7)):
+		before = counties[counties['date'] == last - pd.Timedelta(days=days)].set_index(['state', 'county'])['cases']
+		increase = (latest - before.reindex(latest.index).fillna(0)).sort_values(ascending=False, kind='mergesort')
+		assert [(row['State'], row['County']) for row in tables[table]] == list(increase.index[:len(tables[table])])
+		assert [row[column] for row in tables[table]] == increase.iloc[:len(tables[table])].astype(int).tolist()
+	# the late series reports its whole count as its first week
+	assert tables['weekly'][0] == {'County': 'Late', 'State': 'Alaska', 'New cases (7 days)': 12000}
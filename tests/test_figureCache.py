@@ -0,0 +1,50 @@
+import numpy as np
+
+from figureCache import LRUCache, sizeOf
+
+
+def value(kilobytes):
+	return np.zeros(kilobytes * 1024, dtype=np.uint8)
+
+
+def test_newer_version_clears_and_older_one_does_not():
+	cache = LRUCache(1 << 20)
+	cache.setVersion(2)
+	cache.put('a', value(1))
+	# a request still on the previous dataset
+	cache.setVersion(1)
+	assert cache.get('a') is not None and cache.version == 2
+	cache.setVersion(2)
+	assert cache.get('a') is not None
+	cache.setVersion(3)
+	assert cache.get('a') is None
+	assert len(cache) == 0 and cache.bytes == 0 and cache.version == 3
+
+
+def test_least_recently_used_entries_are_evicted_by_size():
+	one = sizeOf(value(10))
+	cache = LRUCache(3 * one)
+	for key in 'abc':
+		cache.put(key, value(10))
+	cache.get('a')
+	cache.put('d', value(10))
+	assert cache.get('b') is None
+	assert all(cache.get(key) is not None for key in 'acd')
+	assert cache.bytes == 3 * one <= cache.maxBytes
+	assert cache.stats()['evictions'] == 1
+
+
+def test_replacing_a_key_updates_its_size():
+	cache = LRUCache(1 << 20)
+	cache.put('a', value(100))
+	cache.put('a', value(10))
+	assert len(cache) == 1 and cache.bytes == sizeOf(value(10))
+
+
+def test_entries_larger_than_the_cache_are_skipped():
+	cache = LRUCache(sizeOf(value(10)))
+	cache.put('small', value(10))
+	cache.put('big', value(20))
+	assert cache.get('big') is None
+	assert cache.get('small') is not None
+	assert cache.stats()['evictions'] == 0
@@ -0,0 +1,46 @@
+import json
+
+import numpy as np
+import pytest
+
+from payload import DAY_MS, compactTrace, lttb
+
+
+def series(days, seed=0):
+	rng = np.random.default_rng(seed)
+	date = np.datetime64('2020-01-21') + np.arange(days)
+	cases = rng.poisson(30, days).cumsum()
+	return date, cases, (cases * 0.013 + rng.random(days)) / cases
+
+
+def test_short_series_use_start_and_step():
+	date, cases, _ = series(30)
+	trace = compactTrace(date, cases)
+	assert trace['x0'] == '2020-01-21' and trace['dx'] == DAY_MS
+	assert trace['y'] == cases.tolist()
+
+
+@pytest.mark.parametrize('days', [500, 900, 1160, 2500, 10000])
+def test_downsampling_never_grows_the_payload(days):
+	date, cases, mortality = series(days)
+	for values, decimals in ((cases, None), (mortality, 5)):
+		full = compactTrace(date, values, decimals, maxPoints=days)
+		trace = compactTrace(date, values, decimals, maxPoints=800)
+		assert len(json.dumps(trace)) <= len(json.dumps(full))
+
+
+def test_long_series_are_downsampled():
+	date, cases, _ = series(10000)
+	trace = compactTrace(date, cases, maxPoints=800)
+	assert len(trace['x']) == len(trace['y']) == 800
+	assert trace['x'][0] == '2020-01-21' and trace['x'][-1] == str(date[-1])
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+	x = np.arange(1000, dtype=np.float64)
+	y = np.zeros(1000)
+	y[537] = 100
+	keep = lttb(x, y, 50)
+	assert len(keep) == 50
+	assert keep[0] == 0 and keep[-1] == 999 and 537 in keep
+	assert np.all(np.diff(keep) > 0)